@@ -1,14 +1,58 @@
+import asyncio
 import datetime
+import functools
 import logging.config
+from concurrent.futures import ThreadPoolExecutor
 from environs import Env
 from seller import download_stock
 
 import requests
-
-from seller import divide, price_conversion
+from requests.adapters import HTTPAdapter
+
+from seller import (
+    CATALOG_TTL,
+    RETRY,
+    STOCK_BY_COUNT,
+    convert_prices,
+    divide,
+    encode_payload,
+    send_batches,
+    ttl_cache,
+)
 
 logger = logging.getLogger(__file__)
 
+MARKET_API_URL = "https://api.partner.market.yandex.ru/"
+
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=RETRY))
+SESSION.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+
+
+@functools.lru_cache(maxsize=None)
+def get_headers(access_token):
+    """
+    Возвращает заголовки авторизации для API Яндекс.Маркета.
+
+    Словарь строится один раз на токен и переиспользуется всеми запросами.
+    Не изменяйте его.
+
+    Args:
+        access_token(str): Токен для авторизации.
+
+    Returns:
+        dict: Заголовки запроса.
+
+    Examples:
+        Корректное использование:
+            >>> get_headers("token")
+            {'Authorization': 'Bearer token'}
+        Некорректное использование:
+            >>> get_headers(["token"])
+            TypeError: unhashable type: 'list'
+    """
+    return {"Authorization": f"Bearer {access_token}"}
+
 
 def get_product_list(page, campaign_id, access_token):
     """
@@ -40,19 +84,13 @@ def get_product_list(page, campaign_id, access_token):
         requests.exceptions.HTTPError: 401 Client Error
     
     """
-    endpoint_url = "https://api.partner.market.yandex.ru/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json",
-        "Host": "api.partner.market.yandex.ru",
-    }
+    headers = get_headers(access_token)
     payload = {
         "page_token": page,
         "limit": 200,
     }
-    url = endpoint_url + f"campaigns/{campaign_id}/offer-mapping-entries"
-    response = requests.get(url, headers=headers, params=payload)
+    url = MARKET_API_URL + f"campaigns/{campaign_id}/offer-mapping-entries"
+    response = SESSION.get(url, headers=headers, params=payload)
     response.raise_for_status()
     response_object = response.json()
     return response_object.get("result")
@@ -81,16 +119,10 @@ def update_stocks(stocks, campaign_id, access_token):
             >>> update_stocks([], "123456", "token")
             {"status": "ERROR", "message": "Empty stock list"}
     """
-    endpoint_url = "https://api.partner.market.yandex.ru/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json",
-        "Host": "api.partner.market.yandex.ru",
-    }
+    headers = get_headers(access_token)
     payload = {"skus": stocks}
-    url = endpoint_url + f"campaigns/{campaign_id}/offers/stocks"
-    response = requests.put(url, headers=headers, json=payload)
+    url = MARKET_API_URL + f"campaigns/{campaign_id}/offers/stocks"
+    response = SESSION.put(url, headers=headers, data=encode_payload(payload))
     response.raise_for_status()
     response_object = response.json()
     return response_object
@@ -121,24 +153,23 @@ def update_price(prices, campaign_id, access_token):
 
         
     """
-    endpoint_url = "https://api.partner.market.yandex.ru/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json",
-        "Host": "api.partner.market.yandex.ru",
-    }
+    headers = get_headers(access_token)
     payload = {"offers": prices}
-    url = endpoint_url + f"campaigns/{campaign_id}/offer-prices/updates"
-    response = requests.post(url, headers=headers, json=payload)
+    url = MARKET_API_URL + f"campaigns/{campaign_id}/offer-prices/updates"
+    response = SESSION.post(url, headers=headers, data=encode_payload(payload))
     response.raise_for_status()
     response_object = response.json()
     return response_object
 
 
+@ttl_cache(CATALOG_TTL)
 def get_offer_ids(campaign_id, market_token):
     """Получить артикулы товаров Яндекс маркета
 
+    Результат кэшируется по (campaign_id, market_token) на CATALOG_TTL
+    секунд, поэтому повторные вызовы не выгружают каталог заново.
+    Не изменяйте возвращаемый список.
+
     Args:
         campaign_id(str): Индефикатор кампании в Яндекс.Маркете.
         market_token(str): OAuth-токен.
@@ -157,16 +188,16 @@ def get_offer_ids(campaign_id, market_token):
             requests.exceptions.HTTPError: 404 Client Error
     """
     page = ""
-    product_list = []
+    offer_ids = []
     while True:
         some_prod = get_product_list(page, campaign_id, market_token)
-        product_list.extend(some_prod.get("offerMappingEntries"))
+        offer_ids.extend(
+            product.get("offer").get("shopSku")
+            for product in some_prod.get("offerMappingEntries")
+        )
         page = some_prod.get("paging").get("nextPageToken")
         if not page:
             break
-    offer_ids = []
-    for product in product_list:
-        offer_ids.append(product.get("offer").get("shopSku"))
     return offer_ids
 
 
@@ -175,35 +206,36 @@ def create_stocks(watch_remnants, offer_ids, warehouse_id):
     Создает список остатков для загрузки на Яндекс.Маркет.
 
     Args: 
-        watch_remnants(list[dict]): Данные о товарах(остатки).
+        watch_remnants(pd.DataFrame): Данные о товарах(остатки).
         offer_ids(list[str]): Список артикулов.
         warehouse_id(str): Индефикатор склада.
     Returns:
         list[dict]: Список остатков в формате API.
     Examples:
         Корректное использование:
-            >>> remnants = [{"Код": "123", "Количество": "5"}]
+            >>> remnants = pd.DataFrame([{"Код": "123", "Количество": "5"}])
             >>> create_stocks(remnants, ["123"], "1")
             [{"sku": "123", "warehouseId": "1", "items": [{"count": 5, "type": "FIT", "updatedAt": "..."}]}]
         Некорректное использование:
-             >>> create_stocks([{"Количество": "5"}], ["123"], "1")
-            []
+             >>> create_stocks(pd.DataFrame([{"Количество": "5"}]), ["123"], "1")
+            KeyError: 'Код'
     """
     # Уберем то, что не загружено в market
     stocks = list()
-    date = str(datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z")
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            count = str(watch.get("Количество"))
-            if count == ">10":
-                stock = 100
-            elif count == "1":
-                stock = 0
-            else:
-                stock = int(watch.get("Количество"))
+    now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    date = now.isoformat().replace("+00:00", "Z")
+    missing = set(offer_ids)
+    in_offers = watch_remnants["Код"].astype(str).isin(missing)
+    hits = watch_remnants.loc[in_offers, ["Код", "Количество"]].to_dict(orient="records")
+    for watch in hits:
+        code = str(watch["Код"])
+        if code in missing:
+            quantity = watch["Количество"]
+            count = str(quantity)
+            stock = STOCK_BY_COUNT[count] if count in STOCK_BY_COUNT else int(quantity)
             stocks.append(
                 {
-                    "sku": str(watch.get("Код")),
+                    "sku": code,
                     "warehouseId": warehouse_id,
                     "items": [
                         {
@@ -214,22 +246,23 @@ def create_stocks(watch_remnants, offer_ids, warehouse_id):
                     ],
                 }
             )
-            offer_ids.remove(str(watch.get("Код")))
+            missing.remove(code)
     # Добавим недостающее из загруженного:
     for offer_id in offer_ids:
-        stocks.append(
-            {
-                "sku": offer_id,
-                "warehouseId": warehouse_id,
-                "items": [
-                    {
-                        "count": 0,
-                        "type": "FIT",
-                        "updatedAt": date,
-                    }
-                ],
-            }
-        )
+        if offer_id in missing:
+            stocks.append(
+                {
+                    "sku": offer_id,
+                    "warehouseId": warehouse_id,
+                    "items": [
+                        {
+                            "count": 0,
+                            "type": "FIT",
+                            "updatedAt": date,
+                        }
+                    ],
+                }
+            )
     return stocks
 
 
@@ -238,7 +271,7 @@ def create_prices(watch_remnants, offer_ids):
     Сформировать список цен для загрузки на Яндекс.Маркет.
 
     Args:
-        watch_remnants(list[dict]): Данные о товарах(остатки).
+        watch_remnants(pd.DataFrame): Данные о товарах(остатки).
         offer_ids(list[str]): Список артикулов.
         
     Returns:
@@ -246,69 +279,75 @@ def create_prices(watch_remnants, offer_ids):
         
     Examples:
         Корректное использование:
-            >>> remnants = [{"Код": "123", "Цена": "1'000.00 руб."}]
+            >>> remnants = pd.DataFrame([{"Код": "123", "Цена": "1'000.00 руб."}])
             >>> create_prices(remnants, ["123"])
             [{"id": "123", "price": {"value": 1000, "currencyId": "RUR"}}]
 
         Некорректное использование:
-             >>> remnants = [{"Код": "123", "Цена": ""}]
+             >>> remnants = pd.DataFrame([{"Код": "123", "Цена": ""}])
             >>> create_prices(remnants, ["123"])
             ValueError: invalid literal for int() with base 10: ''
     """
+    codes = watch_remnants["Код"].astype(str)
+    in_offers = codes.isin(set(offer_ids))
+    converted = convert_prices(watch_remnants.loc[in_offers, "Цена"])
     prices = []
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            price = {
-                "id": str(watch.get("Код")),
-                # "feed": {"id": 0},
-                "price": {
-                    "value": int(price_conversion(watch.get("Цена"))),
-                    # "discountBase": 0,
-                    "currencyId": "RUR",
-                    # "vat": 0,
-                },
-                # "marketSku": 0,
-                # "shopSku": "string",
-            }
-            prices.append(price)
+    for code, value in zip(codes[in_offers], converted):
+        price = {
+            "id": code,
+            # "feed": {"id": 0},
+            "price": {
+                "value": int(value),
+                # "discountBase": 0,
+                "currencyId": "RUR",
+                # "vat": 0,
+            },
+            # "marketSku": 0,
+            # "shopSku": "string",
+        }
+        prices.append(price)
     return prices
 
 
-async def upload_prices(watch_remnants, campaign_id, market_token):
+async def upload_prices(watch_remnants, campaign_id, market_token, offer_ids=None):
     """
     Загружает цены на Яндекс.Маркет.
 
     Args:
-        watch_remnants(list[str]): Данные о товарах(остатки).
+        watch_remnants(pd.DataFrame): Данные о товарах(остатки).
         campaign_id(str): Индефикатор кампании в Яндекс.Маркете.
         market_token(str): OAuth-токен.
+        offer_ids(list[str], optional): Уже полученные артикулы.
+            Если не переданы, запрашиваются через get_offer_ids.
 
     Returns:
         list[dict]: Список цен.
     Examples:
         Корректное использование:
-            >>> await upload_prices([{"Код": "123", "Цена": "1000"}], "123456", "token")
+            >>> await upload_prices(pd.DataFrame([{"Код": "123", "Цена": "1000"}]), "123456", "token")
             [{"id": "123", "price": {"value": 1000, "currencyId": "RUR"}}]
         Некорректное использование:
-            >>> await upload_prices([], "123456", "token")
+            >>> await upload_prices(pd.DataFrame(columns=["Код", "Цена"]), "123456", "token")
             []
     """
-    offer_ids = get_offer_ids(campaign_id, market_token)
+    if offer_ids is None:
+        offer_ids = get_offer_ids(campaign_id, market_token)
     prices = create_prices(watch_remnants, offer_ids)
-    for some_prices in list(divide(prices, 500)):
-        update_price(some_prices, campaign_id, market_token)
+    await send_batches(update_price, divide(prices, 500), campaign_id, market_token)
     return prices
 
 
-async def upload_stocks(watch_remnants, campaign_id, market_token, warehouse_id):
+async def upload_stocks(watch_remnants, campaign_id, market_token, warehouse_id, offer_ids=None):
     """
     Загружает остатки на Яндекс.Маркет.
 
     Args:
-        watch_remnants(list[str]): Данные о товарах(остатки).
+        watch_remnants(pd.DataFrame): Данные о товарах(остатки).
         campaign_id(str): Индефикатор кампании в Яндекс.Маркете.
         market_token(str): OAuth-токен.
         warehouse_id(str): Индефикатор склада.
+        offer_ids(list[str], optional): Уже полученные артикулы.
+            Если не переданы, запрашиваются через get_offer_ids.
 
     Returns:
         tuple[list[dict], list[dict]]: 
@@ -316,22 +355,67 @@ async def upload_stocks(watch_remnants, campaign_id, market_token, warehouse_id)
             -stocks (все товары).
     Examples:
         Корректное использование:
-            >>> await upload_stocks([{"Код": "123", "Цена": "1000"}], "123456", "token","1")
+            >>> await upload_stocks(pd.DataFrame([{"Код": "123", "Цена": "1000"}]), "123456", "token","1")
             ([{"sku": "123", ...}], [{"sku": "123", ...}])
         Некорректное использование:
-            >>>await upload_stocks([{"Код": "123", "Цена": "1000"}], "123456", "token","1")
+            >>>await upload_stocks(pd.DataFrame([{"Код": "123", "Цена": "1000"}]), "123456", "token","1")
             ([],[])
     """    
-    offer_ids = get_offer_ids(campaign_id, market_token)
+    if offer_ids is None:
+        offer_ids = get_offer_ids(campaign_id, market_token)
     stocks = create_stocks(watch_remnants, offer_ids, warehouse_id)
-    for some_stock in list(divide(stocks, 2000)):
-        update_stocks(some_stock, campaign_id, market_token)
-    not_empty = list(
-        filter(lambda stock: (stock.get("items")[0].get("count") != 0), stocks)
-    )
+    await send_batches(update_stocks, divide(stocks, 2000), campaign_id, market_token)
+    not_empty = [stock for stock in stocks if stock["items"][0]["count"] != 0]
     return not_empty, stocks
 
 
+async def process_campaign(watch_remnants, campaign_id, warehouse_id, market_token, offer_ids):
+    """
+    Обновляет остатки, а затем цены одной кампании на Яндекс.Маркете.
+
+    Args:
+        watch_remnants(pd.DataFrame): Данные о товарах(остатки).
+        campaign_id(str): Индефикатор кампании в Яндекс.Маркете.
+        warehouse_id(str): Индефикатор склада.
+        market_token(str): OAuth-токен.
+        offer_ids(list[str]): Артикулы кампании.
+
+    Examples:
+        Корректное использование:
+            >>> await process_campaign(remnants, "123456", "1", "token", ["123"])
+        Некорректное использование:
+            >>> await process_campaign(remnants, "WRONG_ID", "1", "token", ["123"])
+            requests.exceptions.HTTPError: 404 Client Error
+    """
+    await upload_stocks(watch_remnants, campaign_id, market_token, warehouse_id, offer_ids)
+    await upload_prices(watch_remnants, campaign_id, market_token, offer_ids)
+
+
+async def process_campaigns(watch_remnants, market_token, campaigns):
+    """
+    Параллельно обновляет остатки и цены нескольких кампаний.
+
+    Args:
+        watch_remnants(pd.DataFrame): Данные о товарах(остатки).
+        market_token(str): OAuth-токен.
+        campaigns(list[tuple[str, str, list[str]]]): Кампании в виде
+            (campaign_id, warehouse_id, offer_ids).
+
+    Examples:
+        Корректное использование:
+            >>> await process_campaigns(remnants, "token", [("123456", "1", ["123"]), ("654321", "2", ["123"])])
+        Некорректное использование:
+            >>> await process_campaigns(remnants, "WRONG_TOKEN", [("123456", "1", ["123"])])
+            requests.exceptions.HTTPError: 401 Client Error
+    """
+    await asyncio.gather(
+        *(
+            process_campaign(watch_remnants, campaign_id, warehouse_id, market_token, offer_ids)
+            for campaign_id, warehouse_id, offer_ids in campaigns
+        )
+    )
+
+
 def main():
     """
     Основная функция: Загружает остатки товаров с сайта Casio и обновляет данные в Яндекс.Маркете.
@@ -356,25 +440,18 @@ def main():
     warehouse_fbs_id = env.str("WAREHOUSE_FBS_ID")
     warehouse_dbs_id = env.str("WAREHOUSE_DBS_ID")
 
-    watch_remnants = download_stock()
+    # Каталоги кампаний выгружаются, пока скачиваются остатки Casio
+    with ThreadPoolExecutor() as executor:
+        fbs_offer_ids = executor.submit(get_offer_ids, campaign_fbs_id, market_token)
+        dbs_offer_ids = executor.submit(get_offer_ids, campaign_dbs_id, market_token)
+        watch_remnants = download_stock()
     try:
-        # FBS
-        offer_ids = get_offer_ids(campaign_fbs_id, market_token)
-        # Обновить остатки FBS
-        stocks = create_stocks(watch_remnants, offer_ids, warehouse_fbs_id)
-        for some_stock in list(divide(stocks, 2000)):
-            update_stocks(some_stock, campaign_fbs_id, market_token)
-        # Поменять цены FBS
-        upload_prices(watch_remnants, campaign_fbs_id, market_token)
-
-        # DBS
-        offer_ids = get_offer_ids(campaign_dbs_id, market_token)
-        # Обновить остатки DBS
-        stocks = create_stocks(watch_remnants, offer_ids, warehouse_dbs_id)
-        for some_stock in list(divide(stocks, 2000)):
-            update_stocks(some_stock, campaign_dbs_id, market_token)
-        # Поменять цены DBS
-        upload_prices(watch_remnants, campaign_dbs_id, market_token)
+        # FBS и DBS обновляются одновременно
+        campaigns = [
+            (campaign_fbs_id, warehouse_fbs_id, fbs_offer_ids.result()),
+            (campaign_dbs_id, warehouse_dbs_id, dbs_offer_ids.result()),
+        ]
+        asyncio.run(process_campaigns(watch_remnants, market_token, campaigns))
     except requests.exceptions.ReadTimeout:
         print("Превышено время ожидания...")
     except requests.exceptions.ConnectionError as error:
@@ -1,15 +1,124 @@
+import asyncio
+import functools
 import io
+import json
 import logging.config
-import os
 import re
+import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Optional
 from environs import Env
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__file__)
 
+UPLOAD_CONCURRENCY = 8
+# Общий пул потоков для отправки пачек во всех кампаниях
+UPLOAD_EXECUTOR = ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix="upload")
+
+# Остатки Casio, которые передаются не числом: ">10" выгружаем как 100, "1" как 0
+STOCK_BY_COUNT = {">10": 100, "1": 0}
+
+# Ограничения Ozon: до 100 товаров за запрос остатков и до 1000 за запрос цен
+OZON_STOCKS_BATCH = 100
+OZON_PRICES_BATCH = 1000
+
+NON_DIGITS = re.compile("[^0-9]")
+
+# Сколько секунд каталог товаров считается актуальным
+CATALOG_TTL = 300
+
+OZON_PRODUCT_LIST_URL = "https://api-seller.ozon.ru/v2/product/list"
+OZON_PRICES_URL = "https://api-seller.ozon.ru/v1/product/import/prices"
+OZON_STOCKS_URL = "https://api-seller.ozon.ru/v1/product/import/stocks"
+
+# Повторы с экспоненциальной паузой при лимитах и сбоях на стороне API
+RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET", "POST", "PUT"],
+    raise_on_status=False,
+)
+
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=RETRY))
+SESSION.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+
+
+def ttl_cache(ttl: int, maxsize: int = 8):
+    """
+    Кэшировать результаты функции не дольше ttl секунд.
+
+    Работает как functools.lru_cache, но время делится на окна по ttl
+    секунд и номер окна входит в ключ, поэтому в новом окне функция
+    вызывается заново. Очистить кэш можно через cache_clear().
+
+    Args:
+        ttl (int): Время жизни записи в секундах (>0).
+        maxsize (int): Сколько разных наборов аргументов хранить.
+
+    Returns:
+        callable: Декоратор.
+
+    Examples:
+        Корректно:
+        >>> @ttl_cache(300)
+        ... def get_offer_ids(client_id, seller_token): ...
+
+        Некорректно (ttl=0):
+        >>> @ttl_cache(0)
+        ... def get_offer_ids(client_id, seller_token): ...
+        >>> get_offer_ids("123", "token123")
+        ZeroDivisionError: float floor division by zero
+    """
+    def decorator(func):
+        @functools.lru_cache(maxsize=maxsize)
+        def cached(window, *args):
+            return func(*args)
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            return cached(time.monotonic() // ttl, *args)
+
+        wrapper.cache_clear = cached.cache_clear
+        return wrapper
+
+    return decorator
+
+
+@functools.lru_cache(maxsize=None)
+def get_headers(client_id: str, seller_token: str) -> dict:
+    """
+    Получить заголовки авторизации для API Ozon.
+
+    Словарь строится один раз на пару (client_id, seller_token) и
+    переиспользуется всеми запросами. Не изменяйте его.
+
+    Args:
+        client_id (str): ID клиента Ozon Seller.
+        seller_token (str): Токен API.
+
+    Returns:
+        dict: Заголовки запроса.
+
+    Examples:
+        Корректно:
+        >>> get_headers("123", "token123")
+        {'Client-Id': '123', 'Api-Key': 'token123'}
+
+        Некорректно (нехешируемый аргумент):
+        >>> get_headers(["123"], "token123")
+        TypeError: unhashable type: 'list'
+    """
+    return {"Client-Id": client_id, "Api-Key": seller_token}
+
 
 def get_product_list(last_id: str, client_id: str, seller_token: str) -> dict:
     """
@@ -36,18 +145,23 @@ def get_product_list(last_id: str, client_id: str, seller_token: str) -> dict:
         >>> get_product_list("", "123", "wrong_token")
         requests.exceptions.HTTPError
     """
-    url = "https://api-seller.ozon.ru/v2/product/list"
-    headers = {"Client-Id": client_id, "Api-Key": seller_token}
+    url = OZON_PRODUCT_LIST_URL
+    headers = get_headers(client_id, seller_token)
     payload = {"filter": {"visibility": "ALL"}, "last_id": last_id, "limit": 1000}
-    response = requests.post(url, json=payload, headers=headers)
+    response = SESSION.post(url, data=encode_payload(payload), headers=headers)
     response.raise_for_status()
     return response.json().get("result")
 
 
+@ttl_cache(CATALOG_TTL)
 def get_offer_ids(client_id: str, seller_token: str) -> list[str]:
     """
     Получить список артикулов (offer_id) товаров магазина Ozon.
 
+    Результат кэшируется по (client_id, seller_token) на CATALOG_TTL секунд,
+    поэтому повторные вызовы не выгружают каталог заново.
+    Не изменяйте возвращаемый список.
+
     Args:
         client_id (str): ID клиента Ozon Seller.
         seller_token (str): Токен API.
@@ -69,15 +183,15 @@ def get_offer_ids(client_id: str, seller_token: str) -> list[str]:
         requests.exceptions.HTTPError
     """
     last_id = ""
-    product_list = []
+    offer_ids = []
     while True:
         some_prod = get_product_list(last_id, client_id, seller_token)
-        product_list.extend(some_prod.get("items"))
+        offer_ids.extend(product.get("offer_id") for product in some_prod.get("items"))
         total = some_prod.get("total")
         last_id = some_prod.get("last_id")
-        if total == len(product_list):
+        if total == len(offer_ids):
             break
-    return [product.get("offer_id") for product in product_list]
+    return offer_ids
 
 
 def update_price(prices: list[dict], client_id: str, seller_token: str) -> dict:
@@ -112,10 +226,10 @@ def update_price(prices: list[dict], client_id: str, seller_token: str) -> dict:
         >>> update_price([], "123", "token123")
         {'result': []}  # API не обновит ничего
     """
-    url = "https://api-seller.ozon.ru/v1/product/import/prices"
-    headers = {"Client-Id": client_id, "Api-Key": seller_token}
+    url = OZON_PRICES_URL
+    headers = get_headers(client_id, seller_token)
     payload = {"prices": prices}
-    response = requests.post(url, json=payload, headers=headers)
+    response = SESSION.post(url, data=encode_payload(payload), headers=headers)
     response.raise_for_status()
     return response.json()
 
@@ -147,20 +261,22 @@ def update_stocks(stocks: list[dict], client_id: str, seller_token: str) -> dict
         >>> update_stocks([{"id": "123", "qty": 10}], "123", "token123")
         requests.exceptions.HTTPError
     """
-    url = "https://api-seller.ozon.ru/v1/product/import/stocks"
-    headers = {"Client-Id": client_id, "Api-Key": seller_token}
+    url = OZON_STOCKS_URL
+    headers = get_headers(client_id, seller_token)
     payload = {"stocks": stocks}
-    response = requests.post(url, json=payload, headers=headers)
+    response = SESSION.post(url, data=encode_payload(payload), headers=headers)
     response.raise_for_status()
     return response.json()
 
 
-def download_stock() -> list[dict]:
+def download_stock() -> pd.DataFrame:
     """
     Скачать и обработать файл `ostatki.xls` с сайта Casio.
 
+    Архив распаковывается в памяти, на диск ничего не пишется.
+
     Returns:
-        list[dict]: Список словарей, каждая строка Excel как запись:
+        pd.DataFrame: Таблица остатков, каждая строка Excel как запись:
             - Код (str): Артикул товара.
             - Название (str): Название товара.
             - Количество (str): Остаток (например, ">10" или "1").
@@ -168,12 +284,12 @@ def download_stock() -> list[dict]:
 
     Raises:
         requests.exceptions.RequestException: Если файл не скачан.
-        FileNotFoundError: Если Excel не найден после распаковки.
+        KeyError: Если в архиве нет `ostatki.xls`.
 
     Examples:
         Корректно:
         >>> data = download_stock()
-        >>> isinstance(data, list)
+        >>> isinstance(data, pd.DataFrame)
         True
 
         Некорректно (нет доступа к сайту):
@@ -185,21 +301,19 @@ def download_stock() -> list[dict]:
     response = session.get(casio_url)
     response.raise_for_status()
     with response, zipfile.ZipFile(io.BytesIO(response.content)) as archive:
-        archive.extractall(".")
-    excel_file = "ostatki.xls"
+        excel_file = io.BytesIO(archive.read("ostatki.xls"))
     watch_remnants = pd.read_excel(
         io=excel_file, na_values=None, keep_default_na=False, header=17
-    ).to_dict(orient="records")
-    os.remove("./ostatki.xls")
+    )
     return watch_remnants
 
 
-def create_stocks(watch_remnants: list[dict], offer_ids: list[str]) -> list[dict]:
+def create_stocks(watch_remnants: pd.DataFrame, offer_ids: list[str]) -> list[dict]:
     """
     Сформировать список остатков для API Ozon.
 
     Args:
-        watch_remnants (list[dict]): Данные из Excel Casio.
+        watch_remnants (pd.DataFrame): Данные из Excel Casio.
         offer_ids (list[str]): Артикулы товаров в Ozon.
 
     Returns:
@@ -207,36 +321,37 @@ def create_stocks(watch_remnants: list[dict], offer_ids: list[str]) -> list[dict
 
     Examples:
         Корректно:
-        >>> create_stocks([{"Код": "123", "Количество": ">10"}], ["123"])
+        >>> create_stocks(pd.DataFrame([{"Код": "123", "Количество": ">10"}]), ["123"])
         [{'offer_id': '123', 'stock': 100}]
 
         Некорректно (артикула нет в offer_ids):
-        >>> create_stocks([{"Код": "999", "Количество": "5"}], ["123"])
+        >>> create_stocks(pd.DataFrame([{"Код": "999", "Количество": "5"}]), ["123"])
         [{'offer_id': '123', 'stock': 0}]
     """
     stocks = []
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            count = str(watch.get("Количество"))
-            if count == ">10":
-                stock = 100
-            elif count == "1":
-                stock = 0
-            else:
-                stock = int(watch.get("Количество"))
-            stocks.append({"offer_id": str(watch.get("Код")), "stock": stock})
-            offer_ids.remove(str(watch.get("Код")))
+    missing = set(offer_ids)
+    in_offers = watch_remnants["Код"].astype(str).isin(missing)
+    hits = watch_remnants.loc[in_offers, ["Код", "Количество"]].to_dict(orient="records")
+    for watch in hits:
+        code = str(watch["Код"])
+        if code in missing:
+            quantity = watch["Количество"]
+            count = str(quantity)
+            stock = STOCK_BY_COUNT[count] if count in STOCK_BY_COUNT else int(quantity)
+            stocks.append({"offer_id": code, "stock": stock})
+            missing.remove(code)
     for offer_id in offer_ids:
-        stocks.append({"offer_id": offer_id, "stock": 0})
+        if offer_id in missing:
+            stocks.append({"offer_id": offer_id, "stock": 0})
     return stocks
 
 
-def create_prices(watch_remnants: list[dict], offer_ids: list[str]) -> list[dict]:
+def create_prices(watch_remnants: pd.DataFrame, offer_ids: list[str]) -> list[dict]:
     """
     Сформировать список цен для API Ozon.
 
     Args:
-        watch_remnants (list[dict]): Данные из Excel Casio.
+        watch_remnants (pd.DataFrame): Данные из Excel Casio.
         offer_ids (list[str]): Артикулы товаров в Ozon.
 
     Returns:
@@ -244,25 +359,28 @@ def create_prices(watch_remnants: list[dict], offer_ids: list[str]) -> list[dict
 
     Examples:
         Корректно:
-        >>> create_prices([{"Код": "123", "Цена": "5'990.00 руб."}], ["123"])
+        >>> create_prices(pd.DataFrame([{"Код": "123", "Цена": "5'990.00 руб."}]), ["123"])
         [{'auto_action_enabled': 'UNKNOWN', 'currency_code': 'RUB',
           'offer_id': '123', 'old_price': '0', 'price': '5990'}]
 
         Некорректно (артикула нет в offer_ids):
-        >>> create_prices([{"Код": "999", "Цена": "1000.00 руб."}], ["123"])
+        >>> create_prices(pd.DataFrame([{"Код": "999", "Цена": "1000.00 руб."}]), ["123"])
         []
     """
+    codes = watch_remnants["Код"].astype(str)
+    in_offers = codes.isin(set(offer_ids))
+    converted = convert_prices(watch_remnants.loc[in_offers, "Цена"])
     prices = []
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            price = {
+    for code, price in zip(codes[in_offers], converted):
+        prices.append(
+            {
                 "auto_action_enabled": "UNKNOWN",
                 "currency_code": "RUB",
-                "offer_id": str(watch.get("Код")),
+                "offer_id": code,
                 "old_price": "0",
-                "price": price_conversion(watch.get("Цена")),
+                "price": price,
             }
-            prices.append(price)
+        )
     return prices
 
 
@@ -285,15 +403,40 @@ def price_conversion(price: str) -> str:
         >>> price_conversion("")
         ''
     """
-    return re.sub("[^0-9]", "", price.split(".")[0])
+    return NON_DIGITS.sub("", price.split(".", 1)[0])
+
+
+def convert_prices(prices: pd.Series) -> pd.Series:
+    """
+    Преобразовать столбец цен в числовой формат, как price_conversion, но для всего столбца сразу.
+
+    Args:
+        prices (pd.Series): Цены в формате "5'990.00 руб."
+
+    Returns:
+        pd.Series: Числовые строки, например "5990".
+
+    Examples:
+        Корректно:
+        >>> convert_prices(pd.Series(["5'990.00 руб.", "1'000.00 руб."])).tolist()
+        ['5990', '1000']
+
+        Некорректно (пустая строка):
+        >>> convert_prices(pd.Series([""])).tolist()
+        ['']
+    """
+    return prices.astype(str).str.split(".", n=1).str[0].str.replace(NON_DIGITS, "", regex=True)
 
 
-def divide(lst: list, n: int):
+def divide(lst: Iterable, n: int):
     """
     Разделить список на части по n элементов.
 
+    Список режется срезами, любой другой итерируемый объект читается
+    по n элементов, не загружая его в память целиком.
+
     Args:
-        lst (list): Список для разбиения.
+        lst (Iterable): Список или итерируемый объект для разбиения.
         n (int): Размер подсписка (>0).
 
     Yields:
@@ -313,43 +456,123 @@ def divide(lst: list, n: int):
     """
     if n <= 0:
         raise ValueError("n должно быть больше 0")
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
+    if isinstance(lst, list):
+        for i in range(0, len(lst), n):
+            yield lst[i : i + n]
+        return
+    iterator = iter(lst)
+    while batch := list(islice(iterator, n)):
+        yield batch
 
 
-async def upload_prices(watch_remnants: list[dict], client_id: str, seller_token: str) -> list[dict]:
+def encode_payload(payload: dict) -> bytes:
+    """
+    Закодировать тело запроса в компактный JSON.
+
+    В отличие от json= в requests, не ставит пробелы после "," и ":"
+    и не экранирует кириллицу, поэтому пачки по тысяче товаров заметно легче.
+
+    Args:
+        payload (dict): Тело запроса.
+
+    Returns:
+        bytes: JSON в кодировке UTF-8.
+
+    Raises:
+        ValueError: Если в данных есть NaN или бесконечность.
+
+    Examples:
+        Корректно:
+        >>> encode_payload({"stocks": [{"offer_id": "123", "stock": 10}]})
+        b'{"stocks":[{"offer_id":"123","stock":10}]}'
+
+        Некорректно (NaN в цене):
+        >>> encode_payload({"price": float("nan")})
+        ValueError: Out of range float values are not JSON compliant
+    """
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode()
+
+
+async def send_batches(update, batches, *args) -> list:
+    """
+    Асинхронно отправить пачки данных в API, не более UPLOAD_CONCURRENCY одновременно.
+
+    Синхронная функция отправки выполняется в потоках UPLOAD_EXECUTOR, поэтому
+    запросы по разным пачкам идут параллельно и не блокируют цикл событий.
+    Пачки берутся из batches по мере отправки, а не все сразу.
+
+    Args:
+        update (callable): Функция отправки одной пачки, например update_stocks.
+        batches (iterable): Пачки данных, например результат divide().
+        *args: Остальные аргументы функции update (client_id, токен и т.д.).
+
+    Returns:
+        list: Ответы API в порядке пачек.
+
+    Raises:
+        requests.exceptions.RequestException: Если запрос хотя бы по одной пачке не удался.
+
+    Examples:
+        Корректно:
+        >>> await send_batches(update_stocks, divide(stocks, 100), "123", "token123")
+        [{'result': [...]}, ...]
+
+        Некорректно (нет пачек):
+        >>> await send_batches(update_stocks, [], "123", "token123")
+        []
+    """
+    loop = asyncio.get_running_loop()
+    numbered_batches = enumerate(batches)
+    responses = {}
+
+    async def send():
+        for number, batch in numbered_batches:
+            responses[number] = await loop.run_in_executor(UPLOAD_EXECUTOR, update, batch, *args)
+
+    await asyncio.gather(*(send() for _ in range(UPLOAD_CONCURRENCY)))
+    return [responses[number] for number in sorted(responses)]
+
+
+async def upload_prices(
+    watch_remnants: pd.DataFrame,
+    client_id: str,
+    seller_token: str,
+    offer_ids: Optional[list[str]] = None,
+) -> list[dict]:
     """
     Асинхронно загрузить цены в Ozon.
 
     Args:
-        watch_remnants (list[dict]): Данные Excel Casio.
+        watch_remnants (pd.DataFrame): Данные Excel Casio.
         client_id (str): ID клиента.
         seller_token (str): Токен API.
+        offer_ids (list[str], optional): Уже полученные артикулы.
+            Если не переданы, запрашиваются через get_offer_ids.
 
     Returns:
         list[dict]: Список цен, отправленных в API.
 
     Examples:
         Корректно:
-        >>> await upload_prices([{"Код": "123", "Цена": "1000 руб."}], "123", "token123")
+        >>> await upload_prices(pd.DataFrame([{"Код": "123", "Цена": "1000 руб."}]), "123", "token123")
 
         Некорректно (нет товаров в Excel):
-        >>> await upload_prices([], "123", "token123")
+        >>> await upload_prices(pd.DataFrame(columns=["Код", "Цена"]), "123", "token123")
         []
     """
-    offer_ids = get_offer_ids(client_id, seller_token)
+    if offer_ids is None:
+        offer_ids = get_offer_ids(client_id, seller_token)
     prices = create_prices(watch_remnants, offer_ids)
-    for some_price in list(divide(prices, 1000)):
-        update_price(some_price, client_id, seller_token)
+    await send_batches(update_price, divide(prices, OZON_PRICES_BATCH), client_id, seller_token)
     return prices
 
 
-async def upload_stocks(watch_remnants: list[dict], client_id: str, seller_token: str) -> tuple[list[dict], list[dict]]:
+async def upload_stocks(watch_remnants: pd.DataFrame, client_id: str, seller_token: str) -> tuple[list[dict], list[dict]]:
     """
     Асинхронно загрузить остатки в Ozon.
 
     Args:
-        watch_remnants (list[dict]): Данные Excel Casio.
+        watch_remnants (pd.DataFrame): Данные Excel Casio.
         client_id (str): ID клиента.
         seller_token (str): Токен API.
 
@@ -358,17 +581,16 @@ async def upload_stocks(watch_remnants: list[dict], client_id: str, seller_token
 
     Examples:
         Корректно:
-        >>> await upload_stocks([{"Код": "123", "Количество": "5"}], "123", "token123")
+        >>> await upload_stocks(pd.DataFrame([{"Код": "123", "Количество": "5"}]), "123", "token123")
 
         Некорректно (нет товаров):
-        >>> await upload_stocks([], "123", "token123")
+        >>> await upload_stocks(pd.DataFrame(columns=["Код", "Количество"]), "123", "token123")
         ([], [])
     """
     offer_ids = get_offer_ids(client_id, seller_token)
     stocks = create_stocks(watch_remnants, offer_ids)
-    for some_stock in list(divide(stocks, 100)):
-        update_stocks(some_stock, client_id, seller_token)
-    not_empty = list(filter(lambda stock: (stock.get("stock") != 0), stocks))
+    await send_batches(update_stocks, divide(stocks, OZON_STOCKS_BATCH), client_id, seller_token)
+    not_empty = [stock for stock in stocks if stock["stock"] != 0]
     return not_empty, stocks
 
 
@@ -393,14 +615,19 @@ def main():
     seller_token = env.str("SELLER_TOKEN")
     client_id = env.str("CLIENT_ID")
     try:
-        offer_ids = get_offer_ids(client_id, seller_token)
-        watch_remnants = download_stock()
+        # Каталог Ozon выгружается, пока скачиваются остатки Casio
+        with ThreadPoolExecutor() as executor:
+            offer_ids_future = executor.submit(get_offer_ids, client_id, seller_token)
+            watch_remnants = download_stock()
+        offer_ids = offer_ids_future.result()
         stocks = create_stocks(watch_remnants, offer_ids)
-        for some_stock in list(divide(stocks, 100)):
-            update_stocks(some_stock, client_id, seller_token)
+        asyncio.run(
+            send_batches(update_stocks, divide(stocks, OZON_STOCKS_BATCH), client_id, seller_token)
+        )
         prices = create_prices(watch_remnants, offer_ids)
-        for some_price in list(divide(prices, 900)):
-            update_price(some_price, client_id, seller_token)
+        asyncio.run(
+            send_batches(update_price, divide(prices, OZON_PRICES_BATCH), client_id, seller_token)
+        )
     except requests.exceptions.ReadTimeout:
         print("Превышено время ожидания...")
     except requests.exceptions.ConnectionError as error: